@@ -1,29 +1,131 @@
 from __future__ import division
 import time
+import os
 import math
 import random
+import numpy as np
 from robot import robot
 
 class Gaze(object):
 
-    def __init__(self):
+    def __init__(self, object_angle_filename = "object_angles.txt", registered_angle_filename = "registered_object_angles.txt"):
 
-        # read object angles from file
-        object_yaws = []
-        object_pitches = []
+        self.object_angle_filename = object_angle_filename
+        self.registered_angle_filename = registered_angle_filename
 
-        object_angle_file = open("object_angles.txt")
-        for object_angle in object_angle_file:
-            yaw, pitch = object_angle.split(', ')
-            object_yaws.append(float(yaw))
-            object_pitches.append(float(pitch))
+        # read object angles from the last registration if there was one, otherwise from the hand-measured file
+        if os.path.exists(registered_angle_filename):
+            self.setObjectAngles(self.readObjectAngles(registered_angle_filename))
+        elif os.path.exists(object_angle_filename):
+            self.setObjectAngles(self.readObjectAngles(object_angle_filename))
+        else:
+            self.setObjectAngles([])
 
-        self.confidences = dict.fromkeys(object_yaws, 0)
         self.angle_error = math.radians(15)
 
         # start writing gaze data to robot memory
         robot().subscribeGaze()
 
+    def readObjectAngles(self, filename):
+        """
+        Returns object angles from the given file as a list of [yaw, pitch] in radians, one "yaw, pitch" pair per line.
+        """
+
+        object_angles = []
+
+        object_angle_file = open(filename)
+        for object_angle in object_angle_file:
+            yaw, pitch = object_angle.split(', ')
+            object_angles.append([float(yaw), float(pitch)])
+        object_angle_file.close()
+
+        return object_angles
+
+    def writeObjectAngles(self, object_angles, filename):
+        """
+        Writes the given list of [yaw, pitch] object angles to the given file, one "yaw, pitch" pair per line.
+        """
+
+        object_angle_file = open(filename, "w")
+        for yaw, pitch in object_angles:
+            object_angle_file.write(str(yaw) + ", " + str(pitch) + "\n")
+        object_angle_file.close()
+
+    def setObjectAngles(self, object_angles):
+        """
+        Sets the objects whose gaze counts are tracked to the given list of [yaw, pitch] angles and resets all counts.
+        Counts are stored in dictionary self.confidences, keyed by object yaw.
+        """
+
+        self.object_angles = object_angles
+        self.confidences = dict.fromkeys([yaw for yaw, pitch in object_angles], 0)
+
+    def getScene(self, scene_yaws):
+        """
+        Returns camera thumbnails taken with the head looking down at each of the given yaws, as a numpy array of
+        one 16x12 thumbnail per yaw. Between them, the thumbnails cover the area the objects can be in.
+        """
+
+        scene = []
+
+        for yaw in scene_yaws:
+            robot().turnHead(yaw = yaw, pitch = math.radians(15))
+            time.sleep(1)
+            scene.append(robot().getSceneSignature())
+
+        # let the head settle facing forward before anything else uses the camera
+        robot().turnHead(yaw = 0)
+        time.sleep(1)
+
+        return np.array(scene)
+
+    def registerObjects(self, scene_filename = "object_scene.npy", scene_yaws = (math.radians(-50), 0, math.radians(50)),
+            camera_half_width = math.radians(28), block_threshold = 0.15, debug = False):
+        """
+        Finds the objects in front of the robot and sets them as the objects whose gaze counts are tracked.
+        Reuses the layout in the registered object angle file unless the camera's view from any of the given head yaws
+        differs from the one saved in scene_filename, or any saved object is outside the views. A view differs if any of its
+        thumbnail blocks changed brightness by more than block_threshold (0 to 1), so moving a single object counts.
+        Otherwise it re-runs segmentation and saves the new layout and views.
+        If segmentation finds no objects or returns something unexpected, keeps the previous layout and saves nothing.
+        """
+
+        # look down at the objects from the same head positions every time so camera views can be compared
+        scene = self.getScene(scene_yaws)
+
+        if os.path.exists(self.registered_angle_filename) and os.path.exists(scene_filename):
+            saved_scene = np.load(scene_filename)
+            saved_angles = self.readObjectAngles(self.registered_angle_filename)
+
+            # every saved object should be somewhere the thumbnails can see
+            min_yaw = min(scene_yaws) - camera_half_width
+            max_yaw = max(scene_yaws) + camera_half_width
+            saved_angles_visible = len(saved_angles) > 0 and all(min_yaw <= yaw <= max_yaw for yaw, pitch in saved_angles)
+
+            # if no block of any view has changed, keep the saved layout
+            if saved_angles_visible and saved_scene.shape == scene.shape and \
+                    np.abs(scene - saved_scene).max() < block_threshold:
+                if debug:
+                    print "Scene unchanged, using saved object angles"
+
+                self.setObjectAngles(saved_angles)
+                return
+
+        object_angles = robot().getObjectAngles()
+
+        # don't cache an empty layout, or it would be reused until the scene changes
+        if object_angles is None or len(object_angles) == 0:
+            print "Segmentation found no objects, keeping previous object angles"
+            return
+
+        if debug:
+            print "Scene changed, found object angles:", [[math.degrees(angle) for angle in angles] for angles in object_angles]
+
+        self.writeObjectAngles(object_angles, self.registered_angle_filename)
+        np.save(scene_filename, scene)
+
+        self.setObjectAngles(object_angles)
+
     def updatePersonID(self, debug = False):
         """
         Tries to get people IDs, then if none are retrieved, tries again every 0.5 seconds until it gets some. 
@@ -47,7 +149,8 @@ class Gaze(object):
 
     def updateRawPersonGaze(self):
         """
-        Stores person's gaze as a list of yaw (left -, right +) and pitch (up pi, down 0) in radians, respectively.
+        Stores person's gaze as a list of yaw (left -, right +) and pitch (up pi, down 0) in radians, respectively,
+        along with the robot timestamp of the camera frame it was measured from.
         Bases gaze on both eye and head angles. Does not compensate for variable robot head position.
         """
         
@@ -57,7 +160,7 @@ class Gaze(object):
             self.updatePersonID()
 
         else:
-            self.raw_person_gaze_yaw, self.raw_person_gaze_pitch = self.raw_person_gaze
+            self.raw_person_gaze_yaw, self.raw_person_gaze_pitch, self.raw_person_gaze_time = self.raw_person_gaze
 
     def personLookingAtRobot(self):
         """
@@ -144,7 +247,8 @@ class Gaze(object):
            self.person_gaze = None
 
         else:   
-            robot_head_yaw, robot_head_pitch = robot().getHeadAngles()
+            # use the robot head angles from when the frame was captured, since the face tracker may have moved the head since
+            robot_head_yaw, robot_head_pitch = robot().getHeadAnglesAt(self.raw_person_gaze_time)
             
             # compensate for variable robot head angles
             self.person_gaze_yaw = self.raw_person_gaze_yaw - robot_head_yaw # person's left is (-), person's right is (+)
@@ -266,6 +370,10 @@ class Gaze(object):
 
         print "Object confidences:", [[round(angle, 3), round(self.confidences[angle] * 100)] for angle in self.confidences]
 
+        if len(self.confidences) == 0:
+            print "No objects to guess from"
+            return
+
         max_confidence = max(self.confidences.values()) # or set this to some threshold
         
         # tilt head slightly down so it appears we're looking at the objects
@@ -0,0 +1,90 @@
+from __future__ import division
+import bisect
+import threading
+
+class HeadAngleHistory(object):
+
+    def __init__(self, duration = 2, tolerance = 0.02):
+        """
+        Keeps the last "duration" seconds of timestamped robot head angles so they can be looked up by time.
+        Lookups up to "tolerance" seconds outside the recorded samples get the nearest sample.
+        Angles follow the same conventions as Robot.getHeadAngles.
+        """
+
+        self.duration = duration
+        self.tolerance = tolerance
+
+        # parallel lists sorted by timestamp
+        self.times = []
+        self.yaws = []
+        self.pitches = []
+
+        # samples are recorded from a background thread and read from the main loop
+        self.lock = threading.Lock()
+
+    def record(self, timestamp, yaw, pitch):
+        """
+        Adds head angles measured at the given timestamp in seconds, then forgets samples older than the duration.
+        """
+
+        with self.lock:
+            i = bisect.bisect(self.times, timestamp)
+            self.times.insert(i, timestamp)
+            self.yaws.insert(i, yaw)
+            self.pitches.insert(i, pitch)
+
+            expired = bisect.bisect_left(self.times, self.times[-1] - self.duration)
+            if expired > 0:
+                del self.times[:expired]
+                del self.yaws[:expired]
+                del self.pitches[:expired]
+
+    def clear(self):
+        """
+        Forgets all samples.
+        """
+
+        with self.lock:
+            self.times = []
+            self.yaws = []
+            self.pitches = []
+
+    def latestTime(self):
+        """
+        Returns the timestamp of the newest sample, or None if there are no samples.
+        """
+
+        with self.lock:
+            if len(self.times) == 0:
+                return None
+
+            return self.times[-1]
+
+    def anglesAt(self, timestamp):
+        """
+        Returns head angles at the given timestamp as a list of yaw, pitch, linearly interpolated between the
+        samples on either side. Timestamps just outside the history get the oldest or newest sample.
+        If there are no samples or the timestamp is more than the tolerance outside them, returns None.
+        """
+
+        with self.lock:
+            if len(self.times) == 0:
+                return None
+
+            if timestamp < self.times[0] - self.tolerance or timestamp > self.times[-1] + self.tolerance:
+                return None
+
+            i = bisect.bisect(self.times, timestamp)
+
+            if i == 0:
+                return [self.yaws[0], self.pitches[0]]
+            if i == len(self.times):
+                return [self.yaws[-1], self.pitches[-1]]
+
+            # fraction of the way from the earlier sample to the later one
+            fraction = (timestamp - self.times[i - 1]) / (self.times[i] - self.times[i - 1])
+
+            yaw = self.yaws[i - 1] + fraction * (self.yaws[i] - self.yaws[i - 1])
+            pitch = self.pitches[i - 1] + fraction * (self.pitches[i] - self.pitches[i - 1])
+
+            return [yaw, pitch]
@@ -12,9 +12,15 @@ robot.connect()
 # set game time limit
 game_time = 10
 
-# get into starting position (sitting down, looking up towards person)
 robot.robot().wake()
-robot.robot().turnHead(pitch = math.radians(-10))
+
+gaze = Gaze()
+
+# find objects, only re-running segmentation if they've moved since last time
+gaze.registerObjects()
+
+# get into starting position (sitting down, looking up towards person)
+robot.robot().turnHead(yaw = 0, pitch = math.radians(-10))
 
 # give robot some time to get to this angle before starting face tracker
 time.sleep(0.5)
@@ -25,8 +31,6 @@ robot.robot().trackFace()
 # wait a little to let robot find face
 time.sleep(0.5)
 
-gaze = Gaze()
-
 gaze.findPersonPitchAdjustment()
 
 # set timer
@@ -1,11 +1,15 @@
 import math
 import time
 import os
+import threading
 
 import numpy as np
 # import speech_recognition as sr
 from naoqi import ALModule, ALProxy, ALBroker
 
+from vocab import PhraseMatcher
+from history import HeadAngleHistory
+
 count = 0
 
 def connect(address="bobby.local", port=9559, name="r", brokername="broker"):
@@ -68,6 +72,10 @@ class Robot(ALModule):
 			"scissors": ["scissors"]
 		}
 
+		# index synonyms once so recognizer hypotheses can be matched fuzzily
+		self.yes_no_matcher = PhraseMatcher(self.yes_no_vocab)
+		self.object_matcher = PhraseMatcher(self.object_vocab)
+
 		self.asr.setVocabulary([j for i in self.yes_no_vocab.values() for j in i], False)
 
 		# Custom segmentationation module
@@ -86,6 +94,11 @@ class Robot(ALModule):
 		self.motion.stiffnessInterpolation("Body", 1.0, 1.0)
 		self.pose.goToPosture("Crouch", 0.2)
 
+		# --- head angle history ---
+		self.head_history = HeadAngleHistory()
+		self.head_history_thread = None
+		self.head_clock_warned = False
+
 		# --- face tracking ---
 		self.track = ALProxy("ALFaceTracker", address, port)
 
@@ -157,10 +170,7 @@ class Robot(ALModule):
 		#
 		# print data
 		#
-		# for word in self.yes_no_vocab:
-		# 	for syn in self.yes_no_vocab[word]:
-		# 		if data[0] == syn:
-		# 			return word
+		# return self.yes_no_matcher.bestMatch(data[0])
 
 	def ask_object(self):
 		# TODO: fix this so that speech recognition actually works
@@ -190,13 +200,9 @@ class Robot(ALModule):
 		# 	possibilities = r.recognize(speech, True)
 		# 	print "possibilities:", possibilities
 		# 	for possibility in possibilities:
-		# 		for word in self.object_vocab:
-		# 			for syn in self.object_vocab[word]:
-		# 				if possibility["text"] == unicode(syn):
-		# 					# global broker
-		# 					# broker.shutdown()
-		# 					# exit(0)
-		# 					return possibility
+		# 		word = self.object_matcher.bestMatch(possibility["text"])
+		# 		if word is not None:
+		# 			return word
 		# 	raise LookupError
 		# except LookupError:
 		# 	# self.say("I couldn't understand what you said. Please go to the computer and type the name of your object.")
@@ -208,7 +214,13 @@ class Robot(ALModule):
 		# 	return raw_input("What object were you thinking of?")
 		self.say("What object were you thinking of?")
 		print self.object_vocab.keys()
-		return raw_input("Type the name of the object as seen above. ")
+		answer = raw_input("Type the name of the object as seen above. ")
+
+		# accept typos and synonyms, falling back on exactly what was typed
+		word = self.object_matcher.bestMatch(answer)
+		if word is None:
+			return answer
+		return word
 
 	def wake(self):
 		"""
@@ -248,18 +260,105 @@ class Robot(ALModule):
 
 		self.leds.fadeRGB("FaceLeds", color, fade_duration)
 
-	def getHeadAngles(self):
+	def getHeadAngles(self, use_sensors = False):
 		"""
-		Returns current robot head angles as a list of yaw, pitch.
+		Returns current robot head angles as a list of yaw, pitch, either commanded or, if use_sensors is True, measured.
 		For yaw, from the robot's POV, left is positive and right is negative. For pitch, up is positive and down is negative.
 		See http://doc.aldebaran.com/2-1/family/robots/joints_robot.html for info on the range of its yaw and pitch.
 		"""
 
-		robot_head_yaw, robot_head_pitch = self.motion.getAngles("Head", False)
+		robot_head_yaw, robot_head_pitch = self.motion.getAngles("Head", use_sensors)
 
 		# return adjusted robot head angles
 		return [robot_head_yaw, -robot_head_pitch]
 
+	def getHeadAnglesAt(self, timestamp):
+		"""
+		Returns measured robot head angles at the given robot timestamp in seconds as a list of yaw, pitch, with the same
+		conventions as getHeadAngles. Interpolates between recorded head angles if they're being recorded and cover the
+		timestamp, otherwise returns current measured angles.
+		"""
+
+		head_angles = None
+
+		if not timestamp is None:
+			head_angles = self.head_history.anglesAt(timestamp)
+
+			# a timestamp far outside the history means memory and camera timestamps don't share a clock,
+			# in which case compensation always falls back to current angles
+			latest_time = self.head_history.latestTime()
+			if head_angles is None and not latest_time is None and not self.head_clock_warned and \
+					abs(timestamp - latest_time) > self.head_history.duration:
+				print "Warning: gaze frame time is", round(timestamp - latest_time, 3), "s from the newest head sample,",
+				print "so gaze is compensated with current head angles instead"
+				self.head_clock_warned = True
+
+		if head_angles is None:
+			return self.getHeadAngles(use_sensors = True)
+
+		return head_angles
+
+	def recordHeadAngles(self, period):
+		"""
+		Records timestamped head angles into self.head_history every "period" seconds until stopRecordingHeadAngles() is called.
+		Reads timestamped sensor values from memory, which is expected to share a clock with PeoplePerception
+		(getHeadAnglesAt warns if it doesn't). Skips samples whose yaw and pitch weren't written together.
+		"""
+
+		failing = False
+
+		while self.head_history_thread is threading.current_thread():
+			try:
+				robot_head_pitch, pitch_seconds, pitch_microseconds = self.mem.getTimestamp("Device/SubDeviceList/HeadPitch/Position/Sensor/Value")
+				robot_head_yaw, yaw_seconds, yaw_microseconds = self.mem.getTimestamp("Device/SubDeviceList/HeadYaw/Position/Sensor/Value")
+
+			# RuntimeError: if memory can't be read (e.g. connection hiccup), in which case keep trying
+			except RuntimeError as error:
+				if not failing:
+					print "Couldn't record head angles, retrying:", error
+					failing = True
+
+			else:
+				if failing:
+					print "Recording head angles again"
+					failing = False
+
+				pitch_time = pitch_seconds + pitch_microseconds / 1000000.0
+				yaw_time = yaw_seconds + yaw_microseconds / 1000000.0
+
+				# sensors are updated together, so different timestamps mean an update happened between the two reads
+				if abs(yaw_time - pitch_time) < period:
+					self.head_history.record(yaw_time, robot_head_yaw, -robot_head_pitch)
+
+			time.sleep(period)
+
+	def startRecordingHeadAngles(self, period = 0.01):
+		"""
+		Starts recording timestamped head angles in the background so getHeadAnglesAt() can look them up.
+		"""
+
+		self.stopRecordingHeadAngles()
+		self.head_history.clear()
+		self.head_clock_warned = False
+
+		# allow lookups a couple of samples past either end of the history
+		self.head_history.tolerance = 2 * period
+
+		self.head_history_thread = threading.Thread(target = self.recordHeadAngles, args = (period,))
+		self.head_history_thread.daemon = True
+		self.head_history_thread.start()
+
+	def stopRecordingHeadAngles(self):
+		"""
+		Stops recording head angles and waits for the recording thread to finish.
+		"""
+
+		thread = self.head_history_thread
+		self.head_history_thread = None
+
+		if not thread is None:
+			thread.join()
+
 	def resetEyes(self):
 		"""
 		Turns eye LEDs white.
@@ -269,20 +368,24 @@ class Robot(ALModule):
 
 	def trackFace(self):
 		"""
-		Sets face tracker to just head and starts.
+		Sets face tracker to just head and starts. Also starts recording head angles, since the tracker moves the head.
 		"""
 
 		# start face tracker
 		self.track.setWholeBodyOn(False)
 		self.track.startTracker()
 
+		self.startRecordingHeadAngles()
+
 	def stopTrackingFace(self):
 		"""
-		Stops face tracker.
+		Stops face tracker and head angle recording.
 		"""
 
 		self.track.stopTracker()
 
+		self.stopRecordingHeadAngles()
+
 	def subscribeGaze(self):
 		"""
 		Subscribes to gaze analysis module so that robot starts writing gaze data to memory.
@@ -304,16 +407,33 @@ class Robot(ALModule):
 
 		return people_ids
 
-	def getRawPersonGaze(self, person_id):
+	def getRawPersonGaze(self, person_id, max_write_gap = 0.02):
 		"""
-		Returns person's gaze as a list of yaw (left -, right +) and pitch (up pi, down 0) in radians, respectively.
+		Returns person's gaze as a list of yaw (left -, right +) and pitch (up pi, down 0) in radians, respectively, and the
+		estimated robot timestamp in seconds of the camera frame it was measured from.
 		Bases gaze on both eye and head angles. Does not compensate for variable robot head position.
 		"""
 
 		try:
-			# retrieve GazeDirection and HeadAngles values
-			gaze_dir = self.mem.getData("PeoplePerception/Person/" + str(person_id) + "/GazeDirection")
-			head_angles = self.mem.getData("PeoplePerception/Person/" + str(person_id) + "/HeadAngles")
+			# retrieve GazeDirection and HeadAngles values along with when they were written to memory
+			gaze_dir, gaze_seconds, gaze_microseconds = self.mem.getTimestamp("PeoplePerception/Person/" + str(person_id) + "/GazeDirection")
+			head_angles, head_seconds, head_microseconds = self.mem.getTimestamp("PeoplePerception/Person/" + str(person_id) + "/HeadAngles")
+
+			# latest frame, which holds when its image was taken, along with when it was written to memory
+			people_detected, frame_seconds, frame_microseconds = self.mem.getTimestamp("PeoplePerception/PeopleDetected")
+
+			gaze_time = gaze_seconds + gaze_microseconds / 1000000.0
+			head_time = head_seconds + head_microseconds / 1000000.0
+
+			# values written in different updates may come from different frames
+			if abs(gaze_time - head_time) > max_write_gap:
+				return None
+
+			# estimate when the gaze frame was taken by subtracting PeoplePerception's latency from image to memory.
+			# this leaves out any extra time ALGazeAnalysis takes after that, so the estimate is late by that much
+			image_seconds, image_microseconds = people_detected[0]
+			latency = (frame_seconds + frame_microseconds / 1000000.0) - (image_seconds + image_microseconds / 1000000.0)
+			timestamp = gaze_time - max(latency, 0)
 
 			# extract gaze direction and head angles data
 			person_eye_yaw = gaze_dir[0]
@@ -324,7 +444,8 @@ class Robot(ALModule):
 
 		# RuntimeError: if gaze data can't be retrieved for that person ID anymore (e.g. if bot entirely loses track of person)
 		# IndexError: if gaze direction or head angles are empty lists (e.g. if person's gaze is too steep)
-		except (RuntimeError, IndexError):
+		# TypeError: if any of the values hasn't been written to memory yet
+		except (RuntimeError, IndexError, TypeError):
 			return None
 
 		else:
@@ -332,7 +453,7 @@ class Robot(ALModule):
 			person_gaze_yaw = -(person_eye_yaw + person_head_yaw) # person's left is (-), person's right is (+)
 			person_gaze_pitch = person_eye_pitch + person_head_pitch + math.pi / 2 # all the way up is pi, all the way down is 0
 
-			return [person_gaze_yaw, person_gaze_pitch]
+			return [person_gaze_yaw, person_gaze_pitch, timestamp]
 
 	def getPersonLocation(self, person_id):
 		"""
@@ -361,6 +482,58 @@ class Robot(ALModule):
 		objects = self.segmentation.look_for_objects()
 		return len(objects)
 
+	def getObjectAngles(self):
+		"""
+		Runs the Segmentation module and returns the angles to each object it finds as a list of [yaw, pitch] in radians,
+		relative to spot between robot's feet. For yaw, left is positive and right is negative. For pitch, up is positive.
+		Assumes each segmented object starts with its x, y, z location in meters in the robot frame, since the module's
+		output format isn't documented. Returns None if any object doesn't look like that.
+		"""
+
+		segmented_objects = self.segmentation.look_for_objects()
+
+		if not isinstance(segmented_objects, (list, tuple)):
+			print "Unexpected segmentation result, expected a list of objects:", segmented_objects
+			return None
+
+		object_angles = []
+
+		for segmented_object in segmented_objects:
+			try:
+				x, y, z = [float(coordinate) for coordinate in segmented_object[:3]]
+
+			# TypeError/ValueError: if the object isn't a list starting with 3 numbers
+			except (TypeError, ValueError):
+				print "Unexpected segmentation result, expected x, y, z first:", segmented_object
+				return None
+
+			yaw = math.atan2(y, x)
+			pitch = math.atan2(z, math.hypot(x, y))
+
+			object_angles.append([yaw, pitch])
+
+		return object_angles
+
+	def getSceneSignature(self):
+		"""
+		Returns a 16x12 grayscale thumbnail of what the bottom camera sees, as a numpy array with values from 0 to 1.
+		Comparing thumbnails taken from the same head position tells whether the objects in front of the robot have moved.
+		"""
+
+		# bottom camera, 160x120, luminance only, 5 fps
+		handle = self.cam.subscribeCamera("scene", 1, 0, 0, 5)
+
+		try:
+			image = self.cam.getImageRemote(handle)
+		finally:
+			self.cam.unsubscribe(handle)
+
+		width, height, data = image[0], image[1], image[6]
+		pixels = np.frombuffer(data, dtype = np.uint8).reshape(height, width) / 255.0
+
+		# average 10x10 pixel blocks so camera noise doesn't count as a change
+		return pixels.reshape(height // 10, 10, width // 10, 10).mean(axis = (1, 3))
+
 #------------------------Main------------------------#
 
 if __name__ == "__main__":
@@ -0,0 +1,348 @@
+from __future__ import division
+import re
+import time
+import heapq
+import random
+
+class PhraseMatcher(object):
+
+    def __init__(self, vocab, gram_size = 2, min_similarity = 0.4, min_token_score = 0.6, min_score = 0.6):
+        """
+        Builds inverted indexes over the normalized synonyms in the given vocab, which should be a dictionary of
+        {word: [synonym, ..., synonym], ..., word: [synonym, ..., synonym]}.
+        Each word's own name (underscores read as spaces) is indexed as one of its synonyms.
+        """
+
+        self.gram_size = gram_size
+        self.min_similarity = min_similarity
+        self.min_token_score = min_token_score
+        self.min_score = min_score
+
+        # parallel lists indexed by phrase ID
+        self.phrases = []
+        self.phrase_words = []
+        self.phrase_token_counts = []
+
+        # normalized phrase -> list of phrase IDs, for exact matches
+        self.exact = {}
+
+        # token -> list of phrase IDs containing that token
+        self.token_index = {}
+        self.token_gram_counts = {}
+
+        # character n-gram -> list of distinct tokens containing that n-gram, for correcting misheard tokens
+        self.gram_index = {}
+
+        for word, synonyms in vocab.iteritems():
+            for synonym in [word.replace("_", " ")] + list(synonyms):
+                self.addPhrase(word, synonym)
+
+    def normalize(self, text):
+        """
+        Lowercases text, turns punctuation into spaces, and collapses runs of whitespace.
+        """
+
+        text = re.sub(r"[\W_]+", " ", text.lower(), flags = re.UNICODE)
+        return text.strip()
+
+    def grams(self, token):
+        """
+        Returns the set of character n-grams in the token, padded with spaces so word edges count.
+        """
+
+        padded = " " + token + " "
+        return set(padded[i:i + self.gram_size] for i in range(max(len(padded) - self.gram_size + 1, 1)))
+
+    def addPhrase(self, word, synonym):
+        """
+        Adds a single synonym for the given word to the indexes, skipping duplicates.
+        """
+
+        phrase = self.normalize(synonym)
+
+        for phrase_id in self.exact.get(phrase, []):
+            if self.phrase_words[phrase_id] == word:
+                return
+
+        phrase_id = len(self.phrases)
+        tokens = set(phrase.split())
+
+        self.phrases.append(phrase)
+        self.phrase_words.append(word)
+        self.phrase_token_counts.append(len(tokens))
+        self.exact.setdefault(phrase, []).append(phrase_id)
+
+        for token in tokens:
+            if token not in self.token_index:
+                self.token_index[token] = []
+                grams = self.grams(token)
+                self.token_gram_counts[token] = len(grams)
+                for gram in grams:
+                    self.gram_index.setdefault(gram, []).append(token)
+
+            self.token_index[token].append(phrase_id)
+
+    def editDistance(self, a, b, max_distance):
+        """
+        Returns the Levenshtein distance between strings a and b, or max_distance + 1 once it is known to be larger.
+        Only cells within max_distance of the diagonal are computed.
+        """
+
+        if len(a) < len(b):
+            a, b = b, a
+
+        too_far = max_distance + 1
+        if len(a) - len(b) > max_distance:
+            return too_far
+
+        previous = range(len(b) + 1)
+        for i, char_a in enumerate(a, 1):
+            low = max(1, i - max_distance)
+            high = min(len(b), i + max_distance)
+
+            current = [too_far] * (len(b) + 1)
+            if low == 1:
+                current[0] = i
+
+            row_min = current[low - 1]
+            for j in range(low, high + 1):
+                cost = previous[j - 1] + (char_a != b[j - 1])
+                if previous[j] + 1 < cost:
+                    cost = previous[j] + 1
+                if current[j - 1] + 1 < cost:
+                    cost = current[j - 1] + 1
+                current[j] = cost
+                if cost < row_min:
+                    row_min = cost
+
+            # every path through this row already costs too much
+            if row_min > max_distance:
+                return too_far
+
+            previous = current
+
+        return min(previous[-1], too_far)
+
+    def matchToken(self, token):
+        """
+        Returns the indexed tokens that the given token could be a misspelling or mishearing of,
+        as a list of [token, score] where score is 1 minus the edit distance divided by the longer token length.
+        """
+
+        if token in self.token_index:
+            return [[token, 1.0]]
+
+        # count n-grams shared with each indexed token
+        grams = self.grams(token)
+        shared = {}
+        for gram in grams:
+            for candidate in self.gram_index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        matches = []
+        for candidate, count in shared.iteritems():
+
+            # only check edit distance for tokens with a high enough dice coefficient
+            if 2 * count / (len(grams) + self.token_gram_counts[candidate]) < self.min_similarity:
+                continue
+
+            length = max(len(token), len(candidate))
+            max_distance = int((1 - self.min_token_score) * length)
+            score = 1 - self.editDistance(token, candidate, max_distance) / length
+
+            if score >= self.min_token_score:
+                matches.append([candidate, score])
+
+        return matches
+
+    def tokenize(self, phrase):
+        """
+        Splits a normalized phrase into tokens, joining adjacent tokens that make an indexed token when run
+        together (e.g. "basket ball") and splitting tokens that are two indexed tokens run together (e.g. "redball").
+        """
+
+        tokens = []
+        words = phrase.split()
+
+        i = 0
+        while i < len(words):
+            token = words[i]
+
+            if i + 1 < len(words) and token + words[i + 1] in self.token_index:
+                tokens.append(token + words[i + 1])
+                i += 2
+                continue
+
+            if not token in self.token_index:
+                for j in range(1, len(token)):
+                    if token[:j] in self.token_index and token[j:] in self.token_index:
+                        token = [token[:j], token[j:]]
+                        break
+
+            if isinstance(token, list):
+                tokens.extend(token)
+            else:
+                tokens.append(token)
+            i += 1
+
+        return tokens
+
+    def match(self, text, limit = 5):
+        """
+        Returns up to "limit" matches for the text as a list of [word, synonym, score], best first.
+        Score is the dice coefficient between the text's tokens and the synonym's tokens, where each
+        token pair counts by how closely they're spelled, so only an exact match scores 1.
+        Synonyms must contain every token of the text that is spelled exactly like a vocab token. Other tokens only
+        count toward a synonym's score if it contains something close to them, so filler words like "the" or "please"
+        are ignored even if they happen to look like a vocab token.
+        Each word appears at most once, with its best-scoring synonym.
+        """
+
+        phrase = " ".join(self.tokenize(self.normalize(text)))
+
+        # exact matches skip the fuzzy search entirely
+        if phrase in self.exact:
+            return [[self.phrase_words[phrase_id], self.phrases[phrase_id], 1.0] for phrase_id in self.exact[phrase]][:limit]
+
+        # add up how closely each phrase's tokens match the text's tokens, and how many of the text's tokens they match
+        overlaps = {}
+        exact_covered = {}
+        fuzzy_covered = {}
+        exact_count = 0
+        for token in set(phrase.split()):
+            exact = token in self.token_index
+            if exact:
+                exact_count += 1
+
+            # only count the closest indexed token for each phrase
+            token_scores = {}
+            for candidate, token_score in self.matchToken(token):
+                for phrase_id in self.token_index[candidate]:
+                    token_scores[phrase_id] = max(token_scores.get(phrase_id, 0), token_score)
+
+            covered = exact_covered if exact else fuzzy_covered
+            for phrase_id, token_score in token_scores.iteritems():
+                overlaps[phrase_id] = overlaps.get(phrase_id, 0) + token_score
+                covered[phrase_id] = covered.get(phrase_id, 0) + 1
+
+        # keep each word's best-scoring synonym
+        best = {}
+        for phrase_id, overlap in overlaps.iteritems():
+            if exact_covered.get(phrase_id, 0) < exact_count:
+                continue
+
+            # text tokens counted are the exact ones plus the misspelled ones this phrase matched
+            token_count = exact_count + fuzzy_covered.get(phrase_id, 0)
+            score = min(2 * overlap / (token_count + self.phrase_token_counts[phrase_id]), 1.0)
+
+            word = self.phrase_words[phrase_id]
+            if score >= self.min_score and (word not in best or score > best[word][2]):
+                best[word] = [word, self.phrases[phrase_id], score]
+
+        return heapq.nlargest(limit, best.values(), key = lambda result: result[2])
+
+    def bestMatch(self, text, margin = 0.05):
+        """
+        Returns the word whose synonyms best match the text, or None if nothing matches closely enough
+        or another word scores within "margin" of it, so callers can ask again instead of guessing.
+        """
+
+        matches = self.match(text, limit = 2)
+
+        if len(matches) == 0:
+            return None
+
+        if len(matches) > 1 and matches[0][2] - matches[1][2] <= margin:
+            return None
+
+        return matches[0][0]
+
+#------------------------Benchmark------------------------#
+
+def naiveMatch(vocab, text):
+    """
+    Exact-equality scan over every synonym, the way vocabularies were matched before PhraseMatcher.
+    """
+
+    for word in vocab:
+        for syn in vocab[word]:
+            if text == syn:
+                return word
+
+def misspell(text):
+    """
+    Returns text with one random character substituted, deleted, or inserted.
+    """
+
+    i = random.randrange(len(text))
+    letter = random.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = random.choice(["substitute", "delete", "insert"])
+
+    if edit == "substitute":
+        return text[:i] + letter + text[i + 1:]
+    elif edit == "delete":
+        return text[:i] + text[i + 1:]
+    return text[:i] + letter + text[i:]
+
+if __name__ == "__main__":
+
+    print "#----------Phrase Matcher Benchmark----------#"
+
+    random.seed(0)
+
+    colors = ["red", "orange", "yellow", "green", "blue", "purple", "pink", "black", "white", "brown", "grey", "silver"]
+    sizes = ["big", "small", "tiny", "large", "tall", "short", "round", "square", "striped", "spotted"]
+    nouns = ["ball", "clock", "book", "mug", "box", "flashlight", "apple", "pepper", "cup", "bottle", "shoe", "hat",
+        "block", "car", "truck", "spoon", "bowl", "plate", "pencil", "marker", "toy", "bear", "duck", "phone", "lamp"]
+
+    # build a synthetic vocabulary of objects, each with several synonyms
+    vocab = {}
+    while len(vocab) < 500:
+        color, size, noun = random.choice(colors), random.choice(sizes), random.choice(nouns)
+        synonyms = [color + " " + noun, size + " " + color + " " + noun, size + " " + noun + " that is " + color,
+            "the " + color + " " + noun, color + " " + size + " " + noun]
+        vocab["_".join([size, color, noun])] = synonyms
+
+    start = time.time()
+    matcher = PhraseMatcher(vocab)
+    print "Indexed", len(matcher.phrases), "phrases in", round((time.time() - start) * 1000, 2), "ms"
+
+    queries = []
+    for i in range(2000):
+        word = random.choice(vocab.keys())
+        queries.append([word, random.choice(vocab[word])])
+
+    start = time.time()
+    for word, query in queries:
+        naiveMatch(vocab, query)
+    print "Naive exact scan:", round((time.time() - start) * 1000 / len(queries), 4), "ms per query"
+
+    start = time.time()
+    for word, query in queries:
+        matcher.match(query)
+    print "Indexed exact match:", round((time.time() - start) * 1000 / len(queries), 4), "ms per query"
+
+    misspelled = [[word, misspell(query)] for word, query in queries]
+
+    start = time.time()
+    correct = 0
+    for word, query in misspelled:
+        # several objects can share a synonym, so count a hit if the right word's score ties the best
+        matches = matcher.match(query)
+        if len(matches) > 0 and any(result[0] == word and result[2] == matches[0][2] for result in matches):
+            correct += 1
+    print "Indexed fuzzy match:", round((time.time() - start) * 1000 / len(misspelled), 4), "ms per query,",
+    print round(correct / len(misspelled) * 100, 1), "% correct"
+
+    # recognizer hypotheses often wrap the object name in words that aren't in the vocab
+    fillers = ["um", "its", "a", "please", "i think", "its my", "thing"]
+    padded = [[word, random.choice(fillers) + " " + query + " " + random.choice(fillers)] for word, query in misspelled]
+
+    start = time.time()
+    correct = 0
+    for word, query in padded:
+        matches = matcher.match(query)
+        if len(matches) > 0 and any(result[0] == word and result[2] == matches[0][2] for result in matches):
+            correct += 1
+    print "Indexed fuzzy match with filler words:", round((time.time() - start) * 1000 / len(padded), 4), "ms per query,",
+    print round(correct / len(padded) * 100, 1), "% correct"